@@ -3,51 +3,420 @@ Flask API Server for Smart Meter
 Provides REST endpoints for ESP32 communication and Next.js dashboard
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
-from datetime import datetime, timedelta, timezone
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
+import atexit
+from hashlib import blake2s
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import orjson
 import random
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-from typing import List, Dict, Optional
+import sys
+import threading
+import time
+from typing import Deque, Dict, List, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Buffered logging instead of print: INFO for notable events, DEBUG for the
+# verbose per-request traces (payload dumps, query debugging). Request threads
+# only enqueue records; the actual stream I/O happens on a listener thread so
+# logging never blocks a request.
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_queue_handler = QueueHandler(_log_queue)
+# Keep the enqueued record's message as-is; the listener's handler formats it
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
+logger = logging.getLogger('api')
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson (C-implemented, much faster than stdlib json)"""
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # jsonify/request.json go through orjson
 CORS(app)  # Enable CORS for Next.js frontend
 
 # Supabase configuration (optional)
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY') or os.getenv('SUPABASE_SERVICE_KEY')
+SUPABASE_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '20'))
 supabase_client = None
 
+def _configure_supabase_pool(client) -> None:
+    """Give the PostgREST session a bounded keep-alive connection pool.
+
+    Without this every request thread can open its own TCP+TLS connection to
+    Supabase, paying the handshake each time and risking connection
+    exhaustion under load. One shared pool amortizes handshakes and caps the
+    number of sockets.
+    """
+    try:
+        import httpx
+        old_session = client.postgrest.session
+        client.postgrest.session = httpx.Client(
+            base_url=old_session.base_url,
+            headers=old_session.headers,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=max(SUPABASE_MAX_CONNECTIONS // 2, 1),
+                keepalive_expiry=40.0
+            ),
+            timeout=httpx.Timeout(connect=5, read=30, write=10, pool=5)
+        )
+        old_session.close()
+        atexit.register(client.postgrest.session.close)
+    except Exception as e:
+        logger.warning(f'[Supabase] ⚠ Could not configure connection pool: {e}')
+
 # Initialize Supabase client if credentials are provided
 if SUPABASE_URL and SUPABASE_KEY:
     try:
         from supabase import create_client, Client
         supabase_client: Optional[Client] = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print(f'[Supabase] ✓ Connected to Supabase: {SUPABASE_URL}')
+        _configure_supabase_pool(supabase_client)
+        logger.info(f'[Supabase] ✓ Connected to Supabase: {SUPABASE_URL}')
     except ImportError:
-        print('[Supabase] ⚠ Supabase library not installed. Run: pip install supabase')
+        logger.warning('[Supabase] ⚠ Supabase library not installed. Run: pip install supabase')
         supabase_client = None
     except Exception as e:
-        print(f'[Supabase] ✗ Error connecting to Supabase: {e}')
+        logger.error(f'[Supabase] ✗ Error connecting to Supabase: {e}')
         supabase_client = None
 else:
-    print('[Supabase] ⚠ Supabase not configured. Set SUPABASE_URL and SUPABASE_KEY in .env file')
-    print('[Supabase] Data will be stored in memory only (not persisted)')
+    logger.warning('[Supabase] ⚠ Supabase not configured. Set SUPABASE_URL and SUPABASE_KEY in .env file')
+    logger.warning('[Supabase] Data will be stored in memory only (not persisted)')
+
+@dataclass(slots=True, frozen=True)
+class Reading:
+    """One cached power reading; a slotted record is several times smaller
+    than the equivalent dict and the cache holds up to 100 of them per index"""
+    current: float
+    power: float  # kW, as returned by the API
+    vibration: float
+    timestamp: str
+    equipment: Optional[str] = None
+    user_id: Optional[str] = None
 
 # In-memory storage (used as cache and fallback)
-recent_readings: List[Dict] = []
+# Bounded deque: appendleft is O(1) and the oldest reading is evicted automatically
+recent_readings: Deque[Reading] = deque(maxlen=100)
+# Per-user index into the cache, maintained on ingest so user-filtered GETs
+# don't have to rescan the whole buffer (for future multi-user support)
+user_readings: Dict[str, Deque[Reading]] = defaultdict(lambda: deque(maxlen=100))
 relay_state: str = 'off'
 pending_command: Optional[str] = None
-command_timestamp: Optional[datetime] = None
+# Monotonic deadline after which a pending command expires; cheaper to compare
+# than datetime arithmetic and immune to wall-clock jumps
+_pending_expires_at: float = 0.0
 COMMAND_TIMEOUT_SECONDS = 30  # Command expires after 30 seconds if not confirmed
 
-# Standard voltage for power calculation
+# Flask serves requests from multiple threads; these locks keep the relay
+# command state and the readings cache consistent across concurrent requests
+_relay_lock = threading.RLock()
+_readings_lock = threading.RLock()
+
+# Signalled whenever the dashboard queues a relay command, so long-polling
+# clients wake up immediately instead of waiting for their next poll
+_command_event = threading.Event()
+LONG_POLL_MAX_SECONDS = 25.0
+
+# Standard voltage for power calculation. Python doesn't constant-fold
+# across calls, so the per-amp factors are folded here once instead of
+# redoing the division on every sample.
 STANDARD_VOLTAGE = 230.0
+_POWER_W_PER_AMP = STANDARD_VOLTAGE
+_POWER_KW_PER_AMP = STANDARD_VOLTAGE / 1000.0
+
+# Reject oversized POST bodies before parsing them
+MAX_BODY_BYTES = 1024
+MAX_BATCH_BODY_BYTES = 64 * 1024
+
+UTC = timezone.utc
+
+# fromisoformat accepts a trailing 'Z' natively from 3.11 on; older versions
+# need the Z -> +00:00 rewrite (one extra string allocation per parse)
+if sys.version_info >= (3, 11):
+    _fromisoformat = datetime.fromisoformat
+else:
+    def _fromisoformat(ts: str) -> datetime:
+        return datetime.fromisoformat(ts.replace('Z', '+00:00'))
+
+@lru_cache(maxsize=1024)
+def _parse_utc(ts: str) -> datetime:
+    """Parse an ISO-8601 string (with or without 'Z'/offset) to aware UTC.
+
+    One fast path instead of branchy Z/+00:00 string checks scattered through
+    the handlers; the LRU makes repeated parses of hot timestamps (e.g. an
+    active measurement's start_time on every sample) effectively free.
+    """
+    dt = _fromisoformat(ts)
+    return dt.astimezone(UTC) if dt.tzinfo else dt.replace(tzinfo=UTC)
+
+@lru_cache(maxsize=4096)
+def _normalize_to_utc(ts: str) -> str:
+    """Normalize an ISO-8601 timestamp string to UTC with a 'Z' suffix.
+
+    Shared by the measurement endpoints (which used to redefine this inline
+    per request). Dashboards resend the same start_time over and over, so the
+    cache turns repeat normalizations into a hash lookup.
+    """
+    # Identity fast path: "YYYY-MM-DDTHH:MM:SSZ" is already normalized
+    if len(ts) == 20 and ts.endswith('Z') and ts[10] == 'T':
+        return ts
+    try:
+        return _parse_utc(ts).isoformat().replace('+00:00', 'Z')
+    except Exception as e:
+        logger.warning(f'[API] ⚠ Error normalizing timestamp "{ts}": {e}')
+        return ts
+
+# Tariff period for each hour of the day (valle 0-7, punta 10-13 and 18-21,
+# llano otherwise). The compact byte table is the source of truth so bulk
+# classification can stay numeric; names are resolved only at dict-build time.
+PERIOD_NAMES = ('valle', 'llano', 'punta')
+PERIOD_CODES = bytes([0] * 8 + [1] * 2 + [2] * 4 + [1] * 4 + [2] * 4 + [1] * 2)
+assert len(PERIOD_CODES) == 24
+HOUR_PERIOD = tuple(PERIOD_NAMES[code] for code in PERIOD_CODES)
+
+# Pre-formatted "HH:00:00" suffixes so fallback rows don't re-run the
+# format spec for every hour of every call
+_HOUR_SUFFIX = tuple(f"{h:02d}:00:00" for h in range(24))
+
+# Simulated-price variation bounds per tariff period, resolved to a flat
+# per-hour table at import so the fallback generator does no branching
+_PERIOD_VARIATION = {
+    'valle': (-0.03, 0.01),
+    'llano': (-0.01, 0.02),
+    'punta': (0.02, 0.06),
+}
+_HOUR_VARIATION = tuple(_PERIOD_VARIATION[period] for period in HOUR_PERIOD)
+
+# Matches any of the REE price-indicator markers in one pass over
+# title + magnitude (case-insensitive)
+_PRICE_RE = re.compile(r'pvpc|precio|price|€/mwh|euro|mwh', re.IGNORECASE)
+
+# REE API endpoint and the parts of the query that never change
+REE_URL = "https://apidatos.ree.es/es/datos/mercados/precios-mercados-tiempo-real"
+REE_HEADERS = {'Accept': 'application/json'}
+REE_STATIC_PARAMS = {
+    'time_trunc': 'hour',
+    'geo_trunc': 'electric_system',
+    'geo_limit': 'peninsular',
+    'geo_ids': '8741'
+}
+
+# Shared session for REE API calls: keeps TCP/TLS connections alive between
+# requests and retries transient upstream errors with a small backoff
+_ree_session = requests.Session()
+_ree_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+
+class SegmentedLRU:
+    """Two-tier LRU cache with per-entry TTL.
+
+    New keys enter a small probationary segment and are only promoted to the
+    larger protected segment when they are hit again, so a burst of one-off
+    lookups can't evict entries that keep being re-used. Expired entries are
+    dropped on access.
+    """
+
+    def __init__(self, probation_size: int = 16, protected_size: int = 64):
+        self._probation: OrderedDict = OrderedDict()
+        self._protected: OrderedDict = OrderedDict()
+        self._probation_size = probation_size
+        self._protected_size = protected_size
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if missing/expired"""
+        with self._lock:
+            now = time.monotonic()
+            if key in self._protected:
+                value, expires_at = self._protected[key]
+                if now < expires_at:
+                    self._protected.move_to_end(key)
+                    return value
+                del self._protected[key]
+                return None
+            if key in self._probation:
+                value, expires_at = self._probation.pop(key)
+                if now >= expires_at:
+                    return None
+                # Second hit: promote, demoting the protected LRU entry if full
+                if len(self._protected) >= self._protected_size:
+                    demoted_key, demoted = self._protected.popitem(last=False)
+                    self._probation[demoted_key] = demoted
+                    self._trim_probation()
+                self._protected[key] = (value, expires_at)
+                return value
+            return None
+
+    def put(self, key, value, ttl: float) -> None:
+        """Store a value with the given TTL in seconds"""
+        with self._lock:
+            entry = (value, time.monotonic() + ttl)
+            if key in self._protected:
+                self._protected[key] = entry
+                self._protected.move_to_end(key)
+                return
+            self._probation[key] = entry
+            self._probation.move_to_end(key)
+            self._trim_probation()
+
+    def _trim_probation(self) -> None:
+        while len(self._probation) > self._probation_size:
+            self._probation.popitem(last=False)
+
+# Cache for /api/electricity-prices responses, keyed by date.
+# Today's prices may still be updated by REE so they expire quickly;
+# past days never change and can be kept for much longer.
+_price_cache = SegmentedLRU(probation_size=16, protected_size=64)
+PRICE_CACHE_TTL_TODAY = 15 * 60  # seconds
+PRICE_CACHE_TTL_PAST = 24 * 60 * 60  # seconds
+
+# Single-flight guard: concurrent cache misses for the same date share one
+# in-flight REE fetch instead of each issuing their own
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# Short-lived cache of the single active measurement row, so high-frequency
+# reading POSTs don't have to query Supabase for it on every sample
+_active_meas_cache: Optional[Dict] = None
+_active_meas_expiry: float = 0.0
+_active_meas_lock = threading.Lock()
+ACTIVE_MEASUREMENT_TTL_SECONDS = 3.0
+
+def _get_active_measurement() -> Optional[Dict]:
+    """Return the active measurement row (or None), cached for a few seconds"""
+    global _active_meas_cache, _active_meas_expiry
+
+    with _active_meas_lock:
+        if time.monotonic() < _active_meas_expiry:
+            return _active_meas_cache
+
+    # maybe_single(): PostgREST returns the row itself (or nothing) instead
+    # of a one-element list, so there is no data[0] unwrap
+    result = supabase_client.table('measurements')\
+        .select('equipment, start_time')\
+        .eq('is_active', True)\
+        .order('start_time', desc=True)\
+        .limit(1)\
+        .maybe_single()\
+        .execute()
+    row = result.data if result is not None else None
+
+    with _active_meas_lock:
+        _active_meas_cache = row
+        _active_meas_expiry = time.monotonic() + ACTIVE_MEASUREMENT_TTL_SECONDS
+    return row
+
+def _invalidate_active_measurement_cache() -> None:
+    """Force the next lookup to re-query (measurements were just modified)"""
+    global _active_meas_expiry
+    with _active_meas_lock:
+        _active_meas_expiry = 0.0
+
+# Folded into the measurements ETag: deletes (and terminal saves) can change
+# the completed set without moving max(start_time), which is all the ETag
+# probe sees. Process-local is sound because gunicorn_conf.py pins a single
+# worker.
+_measurements_generation = 0
+
+def _bump_measurements_generation() -> None:
+    global _measurements_generation
+    _measurements_generation += 1
+
+# Rows waiting to be written to power_readings. The POST handlers only
+# enqueue; a background thread flushes them in batches so request latency
+# never includes the database round-trip and one insert commits many rows.
+_pending_rows: Deque[Dict] = deque()
+_pending_rows_lock = threading.Lock()
+DB_FLUSH_INTERVAL_SECONDS = 0.5
+DB_FLUSH_MAX_ROWS = 100
+
+def _enqueue_power_readings(rows: List[Dict]) -> None:
+    """Queue rows for the background flusher (no-op without Supabase)"""
+    if not supabase_client:
+        return
+    with _pending_rows_lock:
+        _pending_rows.extend(rows)
+
+def _flush_pending_rows() -> None:
+    """Drain up to DB_FLUSH_MAX_ROWS queued rows into one batch insert"""
+    with _pending_rows_lock:
+        if not _pending_rows:
+            return
+        count = min(len(_pending_rows), DB_FLUSH_MAX_ROWS)
+        batch = [_pending_rows.popleft() for _ in range(count)]
+    try:
+        supabase_client.table('power_readings').insert(batch).execute()
+        logger.debug('[Supabase] ✓ Flushed %d queued readings', len(batch))
+    except Exception as e:
+        # The readings are still served from the in-memory cache; drop the
+        # batch rather than retrying forever against a broken connection
+        logger.error(f'[Supabase] ✗ Error flushing {len(batch)} queued readings: {e}')
+
+def _db_flusher_loop() -> None:
+    while True:
+        time.sleep(DB_FLUSH_INTERVAL_SECONDS)
+        _flush_pending_rows()
+
+# Non-terminal measurement saves are fire-and-forget: the dashboard resends
+# the running total every few seconds and ignores the response body, so the
+# handler only enqueues (start_time, equipment, total_cost) and this worker
+# performs the Supabase round-trip. Terminal saves (end_time set) stay
+# synchronous because the UI consumes the returned row.
+_measurement_sync_q: queue.Queue = queue.Queue(maxsize=10_000)
+
+def _measurement_sync_loop() -> None:
+    while True:
+        start_time, equipment, total_cost = _measurement_sync_q.get()
+        try:
+            # Update-only on purpose: if a terminal save closed the
+            # measurement while this sync sat in the queue, matching zero
+            # rows is the correct outcome. The sync_active_measurement RPC
+            # would re-create an active row here, resurrecting the closed
+            # measurement and mislabelling every subsequent reading.
+            supabase_client.table('measurements')\
+                .update({'total_cost': total_cost, 'equipment': equipment})\
+                .eq('is_active', True)\
+                .eq('start_time', start_time)\
+                .execute()
+            _invalidate_active_measurement_cache()
+        except Exception as e:
+            logger.error(f'[Supabase] ✗ Error syncing queued measurement: {e}')
+
+if supabase_client:
+    threading.Thread(target=_db_flusher_loop, name='db-flusher', daemon=True).start()
+    threading.Thread(target=_measurement_sync_loop, name='measurement-sync', daemon=True).start()
+    # Best effort: push whatever is still queued when the process exits
+    atexit.register(_flush_pending_rows)
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -63,118 +432,97 @@ def health():
 def post_arduino_data():
     """Receive data from ESP32"""
     try:
-        data = request.json
-        print(f'[API] POST /api/arduino-data - Received: {data}')
-        
-        # Validate data
-        if 'current' not in data or not isinstance(data['current'], (int, float)):
+        # Reject oversized/malformed bodies before doing any work
+        if request.content_length and request.content_length > MAX_BODY_BYTES:
+            return jsonify({
+                'success': False,
+                'message': 'Payload too large'
+            }), 413
+
+        data = request.get_json(silent=True, cache=False)
+        # Lazy %s formatting: the argument isn't stringified unless DEBUG is on
+        logger.debug('[API] POST /api/arduino-data - Received: %s', data)
+
+        # Validate and bind fields once instead of re-indexing the dict below
+        current = data.get('current') if isinstance(data, dict) else None
+        if not isinstance(current, (int, float)):
             return jsonify({
                 'success': False,
                 'message': 'Invalid data format. Expected current as a number.'
             }), 400
-        
-        # Use server timestamp in UTC
-        timestamp = datetime.now(timezone.utc).isoformat()
-        
+
+        # Use server timestamp in UTC (kept as a datetime too, so the
+        # active-measurement comparison below doesn't re-parse the string)
+        now = datetime.now(UTC)
+        timestamp = now.isoformat()
+
         # Calculate power
-        power_kw = (data['current'] * STANDARD_VOLTAGE) / 1000.0
-        
+        power_kw = current * _POWER_KW_PER_AMP
+
         # Get vibration value (default to 0 if not provided)
         vibration = data.get('vibration', 0.0)
         if not isinstance(vibration, (int, float)):
             vibration = 0.0
-        
+
         # Calculate power in Watts (not kW for storage)
-        power_watts = data['current'] * STANDARD_VOLTAGE
-        
+        power_watts = current * _POWER_W_PER_AMP
+
         # Prepare data for storage
-        cache_data = {
-            **data,
-            'vibration': vibration,
-            'power': power_kw,  # Keep kW for API response
-            'timestamp': timestamp
-        }
-        recent_readings.insert(0, cache_data)
-        
-        # Keep last 100 readings in memory cache
-        if len(recent_readings) > 100:
-            recent_readings[:] = recent_readings[:100]
-        
+        cache_data = Reading(
+            current=current,
+            power=power_kw,  # Keep kW for API response
+            vibration=vibration,
+            timestamp=timestamp,
+            equipment=data.get('equipment'),
+            user_id=data.get('user_id')
+        )
+        with _readings_lock:
+            recent_readings.appendleft(cache_data)
+            if cache_data.user_id:
+                user_readings[cache_data.user_id].appendleft(cache_data)
+
         # Save to Supabase if configured
         if supabase_client:
             try:
                 supabase_data = {
                     'timestamp': timestamp,
-                    'current': float(data['current']),
+                    'current': float(current),
                     'power': float(power_watts),  # Store in Watts
                     'vibration': float(vibration)
                 }
-                # Get equipment from request if provided (for frontend tracking)
+                # Equipment in the payload wins: no lookup of any kind
                 equipment = data.get('equipment')
-                
-                # If equipment not provided in request, check for active measurement
-                if not equipment:
+                if equipment:
+                    supabase_data['equipment'] = equipment
+                else:
+                    # Fall back to the active measurement (TTL-cached)
                     try:
-                        active_measurement = supabase_client.table('measurements')\
-                            .select('equipment, start_time')\
-                            .eq('is_active', True)\
-                            .order('start_time', desc=True)\
-                            .limit(1)\
-                            .execute()
-                        
-                        print(f'[API] Checking for active measurement: found {len(active_measurement.data) if active_measurement.data else 0} active measurement(s)')
-                        
-                        if active_measurement.data and len(active_measurement.data) > 0:
-                            measurement = active_measurement.data[0]
+                        measurement = _get_active_measurement()
+
+                        logger.debug('[API] Checking for active measurement: found %d active measurement(s)', 1 if measurement else 0)
+
+                        if measurement:
                             measurement_start_str = measurement['start_time']
                             measurement_equipment = measurement.get('equipment')
                             
-                            print(f'[API] Found active measurement: equipment={measurement_equipment}, start_time={measurement_start_str}')
+                            logger.debug('[API] Found active measurement: equipment=%s, start_time=%s', measurement_equipment, measurement_start_str)
                             
-                            # Parse timestamps - keep both in UTC for comparison
+                            # Compare both sides as aware UTC datetimes
                             try:
-                                # Parse measurement start time (keep UTC)
                                 if isinstance(measurement_start_str, str):
-                                    if 'Z' in measurement_start_str:
-                                        measurement_start = datetime.fromisoformat(measurement_start_str.replace('Z', '+00:00'))
-                                    elif '+' in measurement_start_str:
-                                        measurement_start = datetime.fromisoformat(measurement_start_str)
-                                    else:
-                                        # No timezone, assume UTC
-                                        measurement_start = datetime.fromisoformat(measurement_start_str).replace(tzinfo=timezone.utc)
+                                    measurement_start = _parse_utc(measurement_start_str)
+                                elif measurement_start_str.tzinfo is None:
+                                    measurement_start = measurement_start_str.replace(tzinfo=UTC)
                                 else:
-                                    # Already a datetime object
-                                    measurement_start = measurement_start_str
-                                    if measurement_start.tzinfo is None:
-                                        measurement_start = measurement_start.replace(tzinfo=timezone.utc)
-                                    else:
-                                        # Convert to UTC
-                                        measurement_start = measurement_start.astimezone(timezone.utc)
-                                
-                                # Parse current timestamp (now in UTC from datetime.now(timezone.utc))
-                                if 'Z' in timestamp:
-                                    current_time = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                                elif '+' in timestamp:
-                                    current_time = datetime.fromisoformat(timestamp)
-                                else:
-                                    # No timezone, assume UTC
-                                    current_time = datetime.fromisoformat(timestamp).replace(tzinfo=timezone.utc)
-                                
-                                # Ensure both are in UTC
-                                if current_time.tzinfo is None:
-                                    current_time = current_time.replace(tzinfo=timezone.utc)
-                                else:
-                                    current_time = current_time.astimezone(timezone.utc)
-                                
-                                if measurement_start.tzinfo is None:
-                                    measurement_start = measurement_start.replace(tzinfo=timezone.utc)
-                                else:
-                                    measurement_start = measurement_start.astimezone(timezone.utc)
-                                
+                                    measurement_start = measurement_start_str.astimezone(UTC)
+
+                                # The reading's timestamp came from `now`; no re-parse needed
+                                current_time = now
+
                                 # Use equipment if current timestamp is after or equal to measurement start
                                 # Add buffer (5 seconds) to account for timing differences between frontend and backend
                                 time_diff = (current_time - measurement_start).total_seconds()
-                                print(f'[API] Time comparison (UTC): current={current_time.isoformat()}, measurement_start={measurement_start.isoformat()}, diff={time_diff:.2f}s')
+                                logger.debug('[API] Time comparison (UTC): current=%s, measurement_start=%s, diff=%.2fs', current_time, measurement_start, time_diff)
                                 
                                 # If measurement is active and current time is after start (with buffer), assign equipment
                                 # This ensures all new readings get the equipment label
@@ -182,30 +530,25 @@ def post_arduino_data():
                                     if measurement_equipment:
                                         equipment = measurement_equipment
                                         supabase_data['equipment'] = equipment
-                                        print(f'[API] ✓ Auto-assigned equipment: {equipment} (measurement started at {measurement_start_str}, current: {timestamp}, diff: {time_diff:.2f}s)')
+                                        logger.debug('[API] ✓ Auto-assigned equipment: %s (measurement started at %s, current: %s, diff: %.2fs)', equipment, measurement_start_str, timestamp, time_diff)
                                     else:
-                                        print(f'[API] ⚠ Active measurement found but equipment is NULL')
+                                        logger.warning('[API] ⚠ Active measurement found but equipment is NULL')
                                 else:
-                                    print(f'[API] ⚠ Current time ({current_time}) is before measurement start ({measurement_start}), not assigning equipment (diff: {time_diff:.2f}s)')
+                                    logger.warning('[API] ⚠ Current time (%s) is before measurement start (%s), not assigning equipment (diff: %.2fs)', current_time, measurement_start, time_diff)
                             except Exception as parse_error:
-                                print(f'[Supabase] ✗ Error parsing timestamps: {parse_error}, measurement_start_str={measurement_start_str}, timestamp={timestamp}')
-                                import traceback
-                                traceback.print_exc()
+                                logger.error('[Supabase] ✗ Error parsing timestamps: %s, measurement_start_str=%s, timestamp=%s', parse_error, measurement_start_str, timestamp, exc_info=True)
                         else:
-                            print(f'[API] No active measurement found - new readings will have equipment=NULL')
+                            logger.debug('[API] No active measurement found - new readings will have equipment=NULL')
                     except Exception as e:
-                        print(f'[Supabase] ✗ Error checking active measurement: {e}')
-                        import traceback
-                        traceback.print_exc()
-                elif equipment:
-                    supabase_data['equipment'] = equipment
-                
-                result = supabase_client.table('power_readings').insert(supabase_data).execute()
-                print(f'[Supabase] ✓ Saved to database: id={result.data[0]["id"] if result.data else "unknown"}')
+                        logger.error(f'[Supabase] ✗ Error checking active measurement: {e}', exc_info=True)
+
+                # Hand off to the background flusher; the response doesn't
+                # wait for the database round-trip
+                _enqueue_power_readings([supabase_data])
             except Exception as e:
-                print(f'[Supabase] ✗ Error saving to database: {e}')
+                logger.error(f'[Supabase] ✗ Error saving to database: {e}')
         
-        print(f'[API] ✓ Data stored: current={cache_data["current"]}, vibration={cache_data["vibration"]}, power={cache_data["power"]}, total={len(recent_readings)}')
+        logger.debug('[API] ✓ Data stored: current=%s, vibration=%s, power=%s, total=%d', cache_data.current, cache_data.vibration, cache_data.power, len(recent_readings))
         
         return jsonify({
             'success': True,
@@ -214,13 +557,117 @@ def post_arduino_data():
         })
         
     except Exception as e:
-        print(f'[API] ✗ Error: {e}')
+        logger.error(f'[API] ✗ Error: {e}')
         return jsonify({
             'success': False,
             'message': 'Error processing data',
             'error': str(e)
         }), 500
 
+@app.route('/api/arduino-data/batch', methods=['POST'])
+def post_arduino_data_batch():
+    """Receive a batch of readings from ESP32 in a single request"""
+    try:
+        if request.content_length and request.content_length > MAX_BATCH_BODY_BYTES:
+            return jsonify({
+                'success': False,
+                'message': 'Payload too large'
+            }), 413
+
+        data = request.get_json(silent=True, cache=False)
+        items = data.get('readings') if isinstance(data, dict) else None
+        if not isinstance(items, list) or not items:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid data format. Expected readings as a non-empty list.'
+            }), 400
+
+        # Validate every reading before accepting any of them
+        for item in items:
+            if not isinstance(item, dict) or not isinstance(item.get('current'), (int, float)):
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid data format. Expected current as a number in every reading.'
+                }), 400
+
+        # All readings in the batch share one server timestamp (they arrived together)
+        now = datetime.now(UTC)
+        timestamp = now.isoformat()
+
+        # Same labelling semantics as the single-reading endpoint: items
+        # without an equipment label inherit the active measurement's. One
+        # TTL-cached lookup covers the whole batch.
+        fallback_equipment = None
+        if supabase_client and not all(item.get('equipment') for item in items):
+            try:
+                measurement = _get_active_measurement()
+                if measurement and measurement.get('equipment'):
+                    start = measurement['start_time']
+                    if isinstance(start, str):
+                        measurement_start = _parse_utc(start)
+                    elif start.tzinfo is None:
+                        measurement_start = start.replace(tzinfo=UTC)
+                    else:
+                        measurement_start = start.astimezone(UTC)
+                    # Same 5-second buffer as the single-reading path
+                    if (now - measurement_start).total_seconds() >= -5:
+                        fallback_equipment = measurement['equipment']
+            except Exception as e:
+                logger.error(f'[Supabase] ✗ Error checking active measurement: {e}', exc_info=True)
+
+        cache_items = []
+        supabase_rows = []
+        for item in items:
+            vibration = item.get('vibration', 0.0)
+            if not isinstance(vibration, (int, float)):
+                vibration = 0.0
+            equipment = item.get('equipment') or fallback_equipment
+            cache_items.append(Reading(
+                current=item['current'],
+                power=item['current'] * _POWER_KW_PER_AMP,  # kW for API response
+                vibration=vibration,
+                timestamp=timestamp,
+                equipment=equipment,
+                user_id=item.get('user_id')
+            ))
+            row = {
+                'timestamp': timestamp,
+                'current': float(item['current']),
+                'power': float(item['current'] * _POWER_W_PER_AMP),  # Store in Watts
+                'vibration': float(vibration)
+            }
+            if equipment:
+                row['equipment'] = equipment
+            supabase_rows.append(row)
+
+        # Single lock acquisition for the whole batch; extendleft keeps the
+        # newest reading at the front of the cache
+        with _readings_lock:
+            recent_readings.extendleft(cache_items)
+            for cache_item in cache_items:
+                if cache_item.user_id:
+                    user_readings[cache_item.user_id].appendleft(cache_item)
+
+        # Hand the whole batch to the background flusher in one go
+        _enqueue_power_readings(supabase_rows)
+
+        logger.debug('[API] ✓ Batch stored: %d readings, total=%d', len(cache_items), len(recent_readings))
+
+        return jsonify({
+            'success': True,
+            'message': 'Batch received successfully',
+            'count': len(cache_items),
+            'timestamp': timestamp
+        })
+
+    except Exception as e:
+        logger.error(f'[API] ✗ Error: {e}')
+        return jsonify({
+            'success': False,
+            'message': 'Error processing batch',
+            'error': str(e)
+        }), 500
+
 @app.route('/api/power-readings', methods=['GET'])
 def get_power_readings():
     """Get power readings filtered by equipment and time range"""
@@ -242,109 +689,42 @@ def get_power_readings():
                 'message': 'equipment, start_time, and end_time are required'
             }), 400
         
-        # Query Supabase for readings in the time range with the equipment
-        print(f'[API] Querying power_readings: equipment="{equipment}", start_time="{start_time}", end_time="{end_time}"')
-        print(f'[API] Parameter types: equipment={type(equipment)}, start_time={type(start_time)}, end_time={type(end_time)}')
-        
-        # Normalize timestamps - Supabase accepts ISO format strings
-        # BD format: "2025-12-08 14:49:29.286994+00"
-        # Frontend may send: "2025-12-08T14:49:33.000Z" or "2025-12-08T14:49:33Z"
-        try:
-            from datetime import datetime as dt
-            
-            def normalize_timestamp(ts):
-                if isinstance(ts, str):
-                    # If already in PostgreSQL format (space between date and time), use as-is
-                    if ' ' in ts and ('+' in ts or ts.endswith('Z')):
-                        # Already in correct format or close to it
-                        return ts.replace('Z', '+00:00')
-                    
-                    # Try to parse ISO format (with T) and convert to PostgreSQL format
-                    try:
-                        # Handle both 'Z' and '+00:00' timezone formats
-                        ts_clean = ts.replace('Z', '+00:00')
-                        # Parse the ISO format
-                        if 'T' in ts_clean:
-                            parsed = dt.fromisoformat(ts_clean)
-                        else:
-                            # Already in PostgreSQL format
-                            return ts_clean
-                        
-                        # Format as PostgreSQL TIMESTAMPTZ: "YYYY-MM-DD HH:MM:SS.microseconds+00:00"
-                        # Supabase accepts ISO format, so we can use isoformat() but replace T with space
-                        iso_str = parsed.isoformat()
-                        if '+' not in iso_str:
-                            iso_str += '+00:00'
-                        # Replace T with space to match PostgreSQL format
-                        return iso_str.replace('T', ' ')
-                    except Exception as parse_err:
-                        print(f'[API] ⚠ Could not parse timestamp "{ts}": {parse_err}')
-                        return ts
-                elif hasattr(ts, 'isoformat'):
-                    # Datetime object - convert to string
-                    iso_str = ts.isoformat()
-                    if '+' not in iso_str and 'Z' not in iso_str:
-                        iso_str += '+00:00'
-                    # Replace T with space for PostgreSQL format
-                    return iso_str.replace('Z', '+00:00').replace('T', ' ')
-                else:
-                    return str(ts)
-            
-            start_time_iso = normalize_timestamp(start_time)
-            end_time_iso = normalize_timestamp(end_time)
-            
-            # Convert to ISO format (with T) for Supabase queries
-            # Supabase Python client prefers ISO format
-            def to_iso_format(ts_str):
-                if isinstance(ts_str, str):
-                    # If it has a space, replace with T for ISO format
-                    if ' ' in ts_str and 'T' not in ts_str:
-                        return ts_str.replace(' ', 'T', 1)
-                return ts_str
-            
-            start_time_iso_query = to_iso_format(start_time_iso)
-            end_time_iso_query = to_iso_format(end_time_iso)
-            
-            print(f'[API] Normalized timestamps: start_time="{start_time_iso}", end_time="{end_time_iso}"')
-            print(f'[API] Query format timestamps: start_time="{start_time_iso_query}", end_time="{end_time_iso_query}"')
-        except Exception as ts_error:
-            print(f'[API] ⚠ Error normalizing timestamps: {ts_error}, using original values')
-            import traceback
-            traceback.print_exc()
-            start_time_iso = start_time
-            end_time_iso = end_time
-            # Also set query format (try to convert to ISO if possible)
-            start_time_iso_query = start_time.replace(' ', 'T', 1) if ' ' in start_time and 'T' not in start_time else start_time
-            end_time_iso_query = end_time.replace(' ', 'T', 1) if ' ' in end_time and 'T' not in end_time else end_time
-        
-        # Query exact time range: start_time to end_time
-        print(f'[API] Querying power_readings with exact time range:')
-        print(f'[API]   Equipment: "{equipment}"')
-        print(f'[API]   Start: {start_time_iso_query}')
-        print(f'[API]   End: {end_time_iso_query}')
-        
+        # Supabase accepts ISO-8601 with 'T' as-is; only the 'Z' suffix needs
+        # mapping to an explicit offset. Truly malformed inputs surface as a
+        # query error handled by the outer except.
+        start_time_iso_query = start_time.replace('Z', '+00:00')
+        end_time_iso_query = end_time.replace('Z', '+00:00')
+
+        logger.debug('[API] Querying power_readings: equipment="%s", start="%s", end="%s"', equipment, start_time_iso_query, end_time_iso_query)
+
+
+        # Exact equipment match: eq is sargable against the
+        # (equipment, timestamp) index, whereas ilike forces a filter scan
+        # and treats %/_ in the value as wildcards. Labels are written by
+        # this API from the measurement's own equipment value, so the case
+        # already matches what the dashboard sends back.
         query = supabase_client.table('power_readings')\
-            .select('*')\
-            .eq('equipment', equipment)\
+            .select('id,timestamp,current,power,vibration,equipment')\
+            .eq('equipment', equipment.strip())\
             .gte('timestamp', start_time_iso_query)\
             .lte('timestamp', end_time_iso_query)\
             .order('timestamp', desc=False)\
             .limit(limit)
-        
+
         result = query.execute()
-        
-        readings = []
-        if result.data and len(result.data) > 0:
-            print(f'[API] ✓ Found {len(result.data)} readings in exact time range')
-            if len(result.data) > 0:
-                first_ts = result.data[0].get('timestamp')
-                last_ts = result.data[-1].get('timestamp')
-                print(f'[API]   First reading timestamp: {first_ts}')
-                print(f'[API]   Last reading timestamp: {last_ts}')
-            for row in result.data:
+        rows = result.data or []
+
+        logger.debug('[API] Retrieved %d power readings for equipment=%s from %s to %s', len(rows), equipment, start_time, end_time)
+
+        def generate():
+            # Stream one encoded row at a time instead of materializing a
+            # second 10k-element list of dicts next to the Supabase rows
+            yield b'{"success":true,"data":['
+            first = True
+            for row in rows:
                 # Convert power from Watts to kW for API response
                 power_kw = (row.get('power', 0) / 1000.0) if row.get('power') else 0
-                readings.append({
+                chunk = orjson.dumps({
                     'id': row.get('id'),
                     'timestamp': row.get('timestamp'),
                     'current': row.get('current', 0),
@@ -352,140 +732,123 @@ def get_power_readings():
                     'vibration': row.get('vibration', 0),
                     'equipment': row.get('equipment')
                 })
-        else:
-            print(f'[API] ✗ No readings found in exact time range')
-            # Debug: check what's in the time range without equipment filter
-            debug_query = supabase_client.table('power_readings')\
-                .select('id, timestamp, equipment, power')\
-                .gte('timestamp', start_time_iso_query)\
-                .lte('timestamp', end_time_iso_query)\
-                .order('timestamp', desc=False)\
-                .limit(10)\
-                .execute()
-            
-            if debug_query.data:
-                print(f'[API] ⚠ Found {len(debug_query.data)} readings in time range, but equipment mismatch:')
-                for r in debug_query.data[:5]:
-                    print(f'[API]   - timestamp: {r.get("timestamp")}, equipment: "{r.get("equipment")}", power: {r.get("power")}')
-                
-                # Try case-insensitive equipment match
-                equipment_clean = equipment.strip().lower()
-                matching_rows = [r for r in debug_query.data if r.get('equipment', '').strip().lower() == equipment_clean]
-                if matching_rows:
-                    print(f'[API] ✓ Found {len(matching_rows)} rows with case-insensitive equipment match')
-                    # Re-query with exact equipment value from DB
-                    exact_equipment = matching_rows[0].get('equipment')
-                    fallback_query = supabase_client.table('power_readings')\
-                        .select('*')\
-                        .eq('equipment', exact_equipment)\
-                        .gte('timestamp', start_time_iso_query)\
-                        .lte('timestamp', end_time_iso_query)\
-                        .order('timestamp', desc=False)\
-                        .limit(limit)\
-                        .execute()
-                    
-                    if fallback_query.data:
-                        print(f'[API] ✓ Fallback query found {len(fallback_query.data)} rows with equipment="{exact_equipment}"')
-                        for row in fallback_query.data:
-                            power_kw = (row.get('power', 0) / 1000.0) if row.get('power') else 0
-                            readings.append({
-                                'id': row.get('id'),
-                                'timestamp': row.get('timestamp'),
-                                'current': row.get('current', 0),
-                                'power': power_kw,
-                                'vibration': row.get('vibration', 0),
-                                'equipment': row.get('equipment')
-                            })
-            else:
-                print(f'[API] ✗ No readings found in time range at all')
-                # Check if equipment exists with different timestamps
-                equipment_check = supabase_client.table('power_readings')\
-                    .select('id, timestamp, equipment')\
-                    .eq('equipment', equipment)\
-                    .order('timestamp', desc=True)\
-                    .limit(5)\
-                    .execute()
-                
-                if equipment_check.data:
-                    print(f'[API] ⚠ Equipment "{equipment}" exists but with different timestamps:')
-                    for r in equipment_check.data:
-                        print(f'[API]   - {r.get("timestamp")}')
-        
-        print(f'[API] Retrieved {len(readings)} power readings for equipment={equipment} from {start_time} to {end_time}')
-        
-        return jsonify({
-            'success': True,
-            'data': readings,
-            'count': len(readings)
-        })
+                if first:
+                    first = False
+                    yield chunk
+                else:
+                    yield b',' + chunk
+            yield b'],"count":%d}' % len(rows)
+
+        return app.response_class(stream_with_context(generate()), mimetype='application/json')
         
     except Exception as e:
-        print(f'[API] ✗ Error retrieving power readings: {e}')
-        import traceback
-        traceback.print_exc()
+        logger.error(f'[API] ✗ Error retrieving power readings: {e}', exc_info=True)
         return jsonify({
             'success': False,
             'message': 'Error retrieving power readings',
             'error': str(e)
         }), 500
 
+def _readings_from_cache(limit: int, user_id: Optional[str] = None) -> List[Dict]:
+    """Snapshot recent readings from the in-memory cache.
+
+    When a user_id is given, the per-user index is sliced directly instead of
+    rescanning the whole buffer with a filter.
+    """
+    with _readings_lock:
+        if user_id:
+            snapshot = list(islice(user_readings.get(user_id, ()), limit))
+        else:
+            snapshot = list(islice(recent_readings, limit))
+    # Serialize to dicts only at the response boundary
+    return [asdict(reading) for reading in snapshot]
+
+# Last Supabase page, kept for 1s so a burst of pollers shares one query.
+# A single (limit, monotonic expiry, readings) entry: keying a dict on the
+# client-supplied limit would let callers grow it without bound, and the
+# dashboards all poll with the same limit anyway.
+_arduino_page_cache: Optional[tuple] = None
+_arduino_page_lock = threading.Lock()
+ARDUINO_PAGE_TTL_SECONDS = 1.0
+
 @app.route('/api/arduino-data', methods=['GET'])
 def get_arduino_data():
     """Get recent readings"""
+    global _arduino_page_cache
     try:
         limit = int(request.args.get('limit', 50))
         user_id = request.args.get('user_id')
-        
+
+        # Cheap change detector for polling dashboards: the data only moves
+        # when a new reading lands or the relay flips, so hash the latest
+        # in-memory timestamp + relay state. A matching If-None-Match gets a
+        # body-less 304 without a Supabase query or any serialization.
+        with _readings_lock:
+            latest_ts = recent_readings[0].timestamp if recent_readings else ''
+        etag = f'"{blake2s(f"{latest_ts}|{relay_state}".encode(), digest_size=8).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return '', 304, {'ETag': etag}
+
         # Try to get from Supabase first, fallback to memory cache
         readings = []
-        
+
         if supabase_client:
             try:
-                # Query Supabase for recent readings
-                query = supabase_client.table('power_readings')\
-                    .select('*')\
-                    .order('timestamp', desc=True)\
-                    .limit(limit)
-                
-                result = query.execute()
-                
-                if result.data:
-                    # Convert Supabase format to API format
-                    readings = []
-                    for row in result.data:
-                        # Convert power from Watts to kW for API response
-                        power_kw = (row.get('power', 0) / 1000.0) if row.get('power') else 0
-                        readings.append({
-                            'current': row.get('current', 0),
-                            'power': power_kw,
-                            'vibration': row.get('vibration', 0),
-                            'timestamp': row.get('timestamp'),
-                            'created_date': row.get('timestamp'),  # Alias for compatibility
-                            'equipment': row.get('equipment')  # Include equipment label
-                        })
-                    print(f'[Supabase] ✓ Retrieved {len(readings)} readings from database')
+                with _arduino_page_lock:
+                    entry = _arduino_page_cache
+                    cached = entry[2] if entry and entry[0] == limit \
+                        and time.monotonic() < entry[1] else None
+                if cached is not None:
+                    readings = cached
+                else:
+                    # Query Supabase for recent readings
+                    query = supabase_client.table('power_readings')\
+                        .select('id,timestamp,current,power,vibration,equipment')\
+                        .order('timestamp', desc=True)\
+                        .limit(limit)
+
+                    result = query.execute()
+
+                    if result.data:
+                        # Convert Supabase format to API format
+                        readings = []
+                        for row in result.data:
+                            # Convert power from Watts to kW for API response
+                            power_kw = (row.get('power', 0) / 1000.0) if row.get('power') else 0
+                            readings.append({
+                                'current': row.get('current', 0),
+                                'power': power_kw,
+                                'vibration': row.get('vibration', 0),
+                                'timestamp': row.get('timestamp'),
+                                'created_date': row.get('timestamp'),  # Alias for compatibility
+                                'equipment': row.get('equipment')  # Include equipment label
+                            })
+                        logger.debug('[Supabase] ✓ Retrieved %d readings from database', len(readings))
+                    with _arduino_page_lock:
+                        _arduino_page_cache = (
+                            limit, time.monotonic() + ARDUINO_PAGE_TTL_SECONDS, readings)
+                if user_id:
+                    readings = [r for r in readings if r.get('user_id') == user_id]
             except Exception as e:
-                print(f'[Supabase] ✗ Error querying database: {e}, falling back to memory cache')
-                readings = recent_readings[:limit]
+                logger.error(f'[Supabase] ✗ Error querying database: {e}, falling back to memory cache')
+                readings = _readings_from_cache(limit, user_id)
         else:
             # Use memory cache if Supabase not configured
-            readings = recent_readings[:limit]
-        
-        # Filter by user_id if provided (for future multi-user support)
-        if user_id:
-            readings = [r for r in readings if r.get('user_id') == user_id]
-        
-        print(f'[API] GET /api/arduino-data: Returning {len(readings)} readings')
-        
-        return jsonify({
+            readings = _readings_from_cache(limit, user_id)
+
+        logger.debug('[API] GET /api/arduino-data: Returning %d readings', len(readings))
+
+        response = jsonify({
             'success': True,
             'data': readings,
             'count': len(readings),
             'message': 'Recent readings retrieved successfully'
         })
+        response.headers['ETag'] = etag
+        return response
         
     except Exception as e:
-        print(f'[API] ✗ Error: {e}')
+        logger.error(f'[API] ✗ Error: {e}')
         return jsonify({
             'success': False,
             'message': 'Error retrieving data',
@@ -495,59 +858,87 @@ def get_arduino_data():
 @app.route('/api/relay-control', methods=['GET'])
 def get_relay_control():
     """Check for pending relay commands (ESP32 polls this)"""
-    global pending_command, command_timestamp
-    
-    # Check if command has expired
-    if pending_command and command_timestamp:
-        if datetime.now() - command_timestamp > timedelta(seconds=COMMAND_TIMEOUT_SECONDS):
-            print(f'[Relay API] Command {pending_command} expired (timeout {COMMAND_TIMEOUT_SECONDS}s)')
+    global pending_command
+
+    # Optional long-polling: ?wait=<seconds> holds the request open until a
+    # command is queued (or the timeout elapses), cutting the ESP32 poll rate
+    # from a fixed frequency down to command-driven. Off by default so older
+    # firmware with short HTTP timeouts keeps working.
+    try:
+        wait = min(float(request.args.get('wait', 0)), LONG_POLL_MAX_SECONDS)
+    except (TypeError, ValueError):
+        wait = 0.0
+
+    if wait > 0:
+        with _relay_lock:
+            has_command = pending_command is not None
+        if not has_command:
+            _command_event.wait(timeout=wait)
+            _command_event.clear()
+
+    with _relay_lock:
+        # Check if command has expired (cheap: no datetime arithmetic when idle)
+        if pending_command and time.monotonic() > _pending_expires_at:
+            logger.debug('[Relay API] Command %s expired (timeout %ds)', pending_command, COMMAND_TIMEOUT_SECONDS)
             pending_command = None
-            command_timestamp = None
-    
-    print(f'[Relay API] GET - Current state: {relay_state}, Pending command: {pending_command}')
-    
-    response = {
-        'command': pending_command,
-        'status': relay_state
-    }
-    
+
+        logger.debug('[Relay API] GET - Current state: %s, Pending command: %s', relay_state, pending_command)
+
+        response = {
+            'command': pending_command,
+            'status': relay_state
+        }
+
     return jsonify(response)
 
 @app.route('/api/relay-control', methods=['POST'])
 def post_relay_control():
     """Set relay command or update status"""
-    global relay_state, pending_command, command_timestamp
+    global relay_state, pending_command, _pending_expires_at
     
     try:
-        body = request.json
-        print(f'[Relay API] POST - Received: {body}')
+        if request.content_length and request.content_length > MAX_BODY_BYTES:
+            return jsonify({
+                'success': False,
+                'error': 'Payload too large'
+            }), 413
+
+        body = request.get_json(silent=True, cache=False)
+        if not isinstance(body, dict):
+            return jsonify({
+                'success': False,
+                'error': 'Invalid JSON'
+            }), 400
+        logger.debug('[Relay API] POST - Received: %s', body)
         
         # If ESP32 is sending status update
         if 'status' in body:
             new_status = 'on' if body['status'] == 'on' else 'off'
-            old_state = relay_state
-            relay_state = new_status
-            print(f'[Relay API] Status updated: {old_state} -> {relay_state}')
-            
-            # Clear pending command if it matches the new status (ESP32 confirmed execution)
-            if pending_command == new_status:
-                print(f'[Relay API] Command {pending_command} confirmed by ESP32, clearing pending command')
-                pending_command = None
-                command_timestamp = None
-            
+            with _relay_lock:
+                old_state = relay_state
+                relay_state = new_status
+                logger.debug('[Relay API] Status updated: %s -> %s', old_state, relay_state)
+
+                # Clear pending command if it matches the new status (ESP32 confirmed execution)
+                if pending_command == new_status:
+                    logger.debug('[Relay API] Command %s confirmed by ESP32, clearing pending command', pending_command)
+                    pending_command = None
+
             return jsonify({
                 'success': True,
                 'status': relay_state,
                 'message': f'Relay status updated to {relay_state}'
             })
-        
+
         # If dashboard is sending command
         if 'command' in body:
             command = 'on' if body['command'] == 'on' else 'off'
-            pending_command = command
-            command_timestamp = datetime.now()
-            relay_state = command  # Update immediately for dashboard
-            print(f'[Relay API] Command queued: {command} (will expire in {COMMAND_TIMEOUT_SECONDS}s if not confirmed)')
+            with _relay_lock:
+                pending_command = command
+                _pending_expires_at = time.monotonic() + COMMAND_TIMEOUT_SECONDS
+                relay_state = command  # Update immediately for dashboard
+            _command_event.set()  # Wake any long-polling ESP32 right away
+            logger.debug('[Relay API] Command queued: %s (will expire in %ds if not confirmed)', command, COMMAND_TIMEOUT_SECONDS)
             return jsonify({
                 'success': True,
                 'command': command,
@@ -561,7 +952,7 @@ def post_relay_control():
         }), 400
         
     except Exception as e:
-        print(f'[Relay API] POST error: {e}')
+        logger.error('[Relay API] ✗ POST error: %s', e)
         return jsonify({
             'success': False,
             'error': 'Invalid JSON'
@@ -610,7 +1001,7 @@ def update_equipment():
         result = query.execute()
         updated_count = len(result.data) if result.data else 0
         
-        print(f'[API] Updated equipment label: {equipment} for {updated_count} readings from {start_time} to {end_time or "now"}')
+        logger.debug(f'[API] Updated equipment label: {equipment} for {updated_count} readings from {start_time} to {end_time or "now"}')
         
         return jsonify({
             'success': True,
@@ -619,7 +1010,7 @@ def update_equipment():
         })
         
     except Exception as e:
-        print(f'[API] ✗ Error updating equipment: {e}')
+        logger.error(f'[API] ✗ Error updating equipment: {e}')
         return jsonify({
             'success': False,
             'message': 'Error updating equipment',
@@ -634,9 +1025,10 @@ def save_measurement():
         start_time = data.get('start_time')
         end_time = data.get('end_time')
         equipment = data.get('equipment')
-        total_cost = data.get('total_cost', 0)
+        # Coerce once; JSON numbers usually arrive as float already
+        total_cost = float(data.get('total_cost') or 0)
         
-        print(f'[API] save_measurement received: start_time="{start_time}", end_time="{end_time}", equipment="{equipment}"')
+        logger.debug(f'[API] save_measurement received: start_time="{start_time}", end_time="{end_time}", equipment="{equipment}"')
         
         if not start_time:
             return jsonify({
@@ -645,34 +1037,10 @@ def save_measurement():
             }), 400
         
         # Normalize timestamps to ensure UTC format
-        from datetime import datetime, timezone
-        def normalize_to_utc(ts_str):
-            """Normalize timestamp string to UTC ISO format"""
-            if not ts_str:
-                return ts_str
-            try:
-                # Parse the timestamp
-                if isinstance(ts_str, str):
-                    # Remove 'Z' and replace with +00:00 if needed
-                    ts_clean = ts_str.replace('Z', '+00:00')
-                    # Parse to datetime
-                    dt_obj = datetime.fromisoformat(ts_clean.replace('Z', '+00:00'))
-                    # Ensure UTC timezone
-                    if dt_obj.tzinfo is None:
-                        dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-                    # Convert to UTC if not already
-                    dt_utc = dt_obj.astimezone(timezone.utc)
-                    # Return in ISO format with Z
-                    return dt_utc.isoformat().replace('+00:00', 'Z')
-                return ts_str
-            except Exception as e:
-                print(f'[API] ⚠ Error normalizing timestamp "{ts_str}": {e}')
-                return ts_str
-        
-        start_time_utc = normalize_to_utc(start_time)
-        end_time_utc = normalize_to_utc(end_time) if end_time else None
+        start_time_utc = _normalize_to_utc(start_time)
+        end_time_utc = _normalize_to_utc(end_time) if end_time else None
         
-        print(f'[API] Normalized timestamps: start_time="{start_time_utc}", end_time="{end_time_utc}"')
+        logger.debug(f'[API] Normalized timestamps: start_time="{start_time_utc}", end_time="{end_time_utc}"')
         
         # If no Supabase, skip
         if not supabase_client:
@@ -681,80 +1049,37 @@ def save_measurement():
                 'message': 'Supabase not configured, skipping measurement save'
             })
         
-        # If ending a measurement (has end_time), update existing active measurement
-        if end_time_utc:
-            # Find and update the active measurement with this start_time
-            existing = supabase_client.table('measurements')\
-                .select('*')\
-                .eq('is_active', True)\
-                .eq('start_time', start_time_utc)\
-                .execute()
-            
-            if existing.data and len(existing.data) > 0:
-                # Update existing active measurement and deactivate it
-                print(f'[API] Deactivating active measurement: id={existing.data[0]["id"]}, start_time={start_time_utc}')
-                result = supabase_client.table('measurements')\
-                    .update({
-                        'end_time': end_time_utc,
-                        'total_cost': float(total_cost),
-                        'is_active': False
-                    })\
-                    .eq('id', existing.data[0]['id'])\
-                    .execute()
-                print(f'[API] ✓ Measurement deactivated: {result.data[0] if result.data else "unknown"}')
-            else:
-                # No active measurement found with exact start_time, try to find any active measurement
-                # This handles cases where timestamp format might differ slightly
-                any_active = supabase_client.table('measurements')\
-                    .select('*')\
-                    .eq('is_active', True)\
-                    .limit(1)\
-                    .execute()
-                
-                if any_active.data and len(any_active.data) > 0:
-                    # Update the active measurement we found
-                    print(f'[API] Found active measurement with different start_time, deactivating: id={any_active.data[0]["id"]}')
-                    result = supabase_client.table('measurements')\
-                        .update({
-                            'end_time': end_time_utc,
-                            'start_time': start_time_utc,  # Update to match frontend (UTC normalized)
-                            'equipment': equipment,
-                            'total_cost': float(total_cost),
-                            'is_active': False
-                        })\
-                        .eq('id', any_active.data[0]['id'])\
-                        .execute()
-                    print(f'[API] ✓ Measurement deactivated: {result.data[0] if result.data else "unknown"}')
-                else:
-                    # No active measurement found at all, create new completed one
-                    print(f'[API] No active measurement found, creating completed measurement')
-                    measurement_data = {
-                        'start_time': start_time_utc,
-                        'end_time': end_time_utc,
-                        'equipment': equipment,
-                        'total_cost': float(total_cost),
-                        'is_active': False
-                    }
-                    result = supabase_client.table('measurements').insert(measurement_data).execute()
-        else:
-            # Creating/updating active measurement
-            # Deactivate any existing active measurements first
-            supabase_client.table('measurements')\
-                .update({'is_active': False})\
-                .eq('is_active', True)\
-                .execute()
-            
-            measurement_data = {
-                'start_time': start_time,
-                'end_time': None,
-                'equipment': equipment,
-                'total_cost': float(total_cost),
-                'is_active': True
-            }
-            result = supabase_client.table('measurements').insert(measurement_data).execute()
-        
+        # Progress saves (no end_time) are fire-and-forget: queue the sync
+        # for the background worker and acknowledge immediately, so the
+        # client's latency is Flask-local instead of Flask + Supabase
+        if end_time_utc is None:
+            try:
+                _measurement_sync_q.put_nowait(
+                    (start_time_utc, equipment, total_cost))
+            except queue.Full:
+                logger.warning('[API] ⚠ Measurement sync queue full, dropping progress save')
+            return jsonify({
+                'success': True,
+                'message': 'Measurement sync queued'
+            }), 202
+
+        # One atomic round-trip: the sync_active_measurement stored function
+        # (see supabase_setup.sql) closes/updates/creates the measurement
+        # server-side, replacing the old select -> update -> insert sequence
+        result = supabase_client.rpc('sync_active_measurement', {
+            'p_start_time': start_time_utc,
+            'p_end_time': end_time_utc,
+            'p_equipment': equipment,
+            'p_total_cost': total_cost
+        }).execute()
+
+        _invalidate_active_measurement_cache()
+        # A terminal save grows the completed set; make polling dashboards
+        # revalidate instead of reusing a pre-save 304
+        _bump_measurements_generation()
+
         if result.data:
-            print(f'[API] ✓ Saved measurement: equipment={equipment}, cost={total_cost}€')
+            logger.info(f'[API] ✓ Saved measurement: equipment={equipment}, cost={total_cost}€')
             return jsonify({
                 'success': True,
                 'message': 'Measurement saved successfully',
@@ -767,7 +1092,7 @@ def save_measurement():
             }), 500
         
     except Exception as e:
-        print(f'[API] ✗ Error saving measurement: {e}')
+        logger.error(f'[API] ✗ Error saving measurement: {e}')
         return jsonify({
             'success': False,
             'message': 'Error saving measurement',
@@ -780,7 +1105,10 @@ def get_measurements():
     try:
         limit = int(request.args.get('limit', 50))
         equipment = request.args.get('equipment')  # Optional filter
-        
+        # Keyset pagination cursor: only measurements older than this
+        # start_time (avoids OFFSET scans when paging deep into history)
+        before = request.args.get('before')
+
         # If no Supabase, return empty
         if not supabase_client:
             return jsonify({
@@ -791,7 +1119,24 @@ def get_measurements():
         
         # Check if we want only active measurement
         active_only = request.args.get('active_only', 'false').lower() == 'true'
-        
+
+        # Weak change detector: the newest completed start_time plus the query
+        # parameters. The probe query is one tiny row; a match skips the full
+        # page fetch and its serialization for polling dashboards.
+        if not active_only:
+            latest = supabase_client.table('measurements')\
+                .select('start_time')\
+                .eq('is_active', False)\
+                .order('start_time', desc=True)\
+                .limit(1)\
+                .execute()
+            latest_start = latest.data[0]['start_time'] if latest.data else ''
+            etag = f'"{blake2s(f"{latest_start}|{limit}|{equipment}|{before}|{_measurements_generation}".encode(), digest_size=8).hexdigest()}"'
+            if request.headers.get('If-None-Match') == etag:
+                return '', 304, {'ETag': etag, 'Cache-Control': 'private, max-age=5'}
+        else:
+            etag = None
+
         if active_only:
             # Get only the active measurement
             query = supabase_client.table('measurements')\
@@ -799,30 +1144,43 @@ def get_measurements():
                 .eq('is_active', True)\
                 .limit(1)
         else:
-            # Get completed measurements (history)
+            # Get completed measurements (history); project only the columns
+            # the dashboard renders instead of SELECT *
             query = supabase_client.table('measurements')\
-                .select('*')\
+                .select('id,start_time,end_time,equipment,total_cost')\
                 .eq('is_active', False)\
                 .order('start_time', desc=True)\
                 .limit(limit)
-            
+
             if equipment:
                 query = query.eq('equipment', equipment)
-        
+            if before:
+                query = query.lt('start_time', before)
+
         result = query.execute()
-        
+
         measurements = result.data if result.data else []
-        
-        print(f'[API] ✓ Retrieved {len(measurements)} measurements from database')
-        
-        return jsonify({
+
+        logger.info(f'[API] ✓ Retrieved {len(measurements)} measurements from database')
+
+        # A full page means there may be older rows; clients pass this back
+        # as ?before= to fetch the next page
+        next_cursor = measurements[-1]['start_time'] \
+            if not active_only and len(measurements) == limit else None
+
+        response = jsonify({
             'success': True,
             'data': measurements,
-            'count': len(measurements)
+            'count': len(measurements),
+            'next_cursor': next_cursor
         })
+        if etag:
+            response.headers['ETag'] = etag
+            response.headers['Cache-Control'] = 'private, max-age=5'
+        return response
         
     except Exception as e:
-        print(f'[API] ✗ Error retrieving measurements: {e}')
+        logger.error(f'[API] ✗ Error retrieving measurements: {e}')
         return jsonify({
             'success': False,
             'message': 'Error retrieving measurements',
@@ -835,7 +1193,8 @@ def update_active_measurement():
     try:
         data = request.json
         start_time = data.get('start_time')
-        total_cost = data.get('total_cost', 0)
+        # Coerce once; JSON numbers usually arrive as float already
+        total_cost = float(data.get('total_cost') or 0)
         equipment = data.get('equipment')
         
         if not start_time:
@@ -854,13 +1213,15 @@ def update_active_measurement():
         # Find active measurement with this start_time
         result = supabase_client.table('measurements')\
             .update({
-                'total_cost': float(total_cost),
+                'total_cost': total_cost,
                 'equipment': equipment
             })\
             .eq('is_active', True)\
             .eq('start_time', start_time)\
             .execute()
-        
+
+        _invalidate_active_measurement_cache()
+
         if result.data:
             return jsonify({
                 'success': True,
@@ -874,7 +1235,7 @@ def update_active_measurement():
             }), 404
         
     except Exception as e:
-        print(f'[API] ✗ Error updating active measurement: {e}')
+        logger.error(f'[API] ✗ Error updating active measurement: {e}')
         return jsonify({
             'success': False,
             'message': 'Error updating active measurement',
@@ -888,9 +1249,10 @@ def create_active_measurement():
         data = request.json
         start_time = data.get('start_time')
         equipment = data.get('equipment')
-        total_cost = data.get('total_cost', 0)
+        # Coerce once; JSON numbers usually arrive as float already
+        total_cost = float(data.get('total_cost') or 0)
         
-        print(f'[API] create_active_measurement received: start_time="{start_time}", equipment="{equipment}"')
+        logger.debug(f'[API] create_active_measurement received: start_time="{start_time}", equipment="{equipment}"')
         
         if not start_time:
             return jsonify({
@@ -899,26 +1261,8 @@ def create_active_measurement():
             }), 400
         
         # Normalize timestamp to UTC
-        from datetime import datetime, timezone
-        def normalize_to_utc(ts_str):
-            """Normalize timestamp string to UTC ISO format"""
-            if not ts_str:
-                return ts_str
-            try:
-                if isinstance(ts_str, str):
-                    ts_clean = ts_str.replace('Z', '+00:00')
-                    dt_obj = datetime.fromisoformat(ts_clean)
-                    if dt_obj.tzinfo is None:
-                        dt_obj = dt_obj.replace(tzinfo=timezone.utc)
-                    dt_utc = dt_obj.astimezone(timezone.utc)
-                    return dt_utc.isoformat().replace('+00:00', 'Z')
-                return ts_str
-            except Exception as e:
-                print(f'[API] ⚠ Error normalizing timestamp "{ts_str}": {e}')
-                return ts_str
-        
-        start_time_utc = normalize_to_utc(start_time)
-        print(f'[API] Normalized start_time to UTC: "{start_time_utc}"')
+        start_time_utc = _normalize_to_utc(start_time)
+        logger.debug(f'[API] Normalized start_time to UTC: "{start_time_utc}"')
         
         # If no Supabase, skip
         if not supabase_client:
@@ -927,42 +1271,20 @@ def create_active_measurement():
                 'message': 'Supabase not configured'
             })
         
-        # Check if active measurement already exists
-        existing = supabase_client.table('measurements')\
-            .select('*')\
-            .eq('is_active', True)\
-            .execute()
-        
-        if existing.data and len(existing.data) > 0:
-            # Update existing active measurement
-            print(f'[API] Updating existing active measurement: start_time={start_time_utc}, equipment={equipment}')
-            result = supabase_client.table('measurements')\
-                .update({
-                    'start_time': start_time_utc,
-                    'equipment': equipment,
-                    'total_cost': float(total_cost)
-                })\
-                .eq('is_active', True)\
-                .execute()
-        else:
-            # Create new active measurement
-            # First deactivate any old ones (safety)
-            print(f'[API] Creating new active measurement: start_time={start_time_utc}, equipment={equipment}')
-            supabase_client.table('measurements')\
-                .update({'is_active': False})\
-                .eq('is_active', True)\
-                .execute()
-            
-            result = supabase_client.table('measurements').insert({
-                'start_time': start_time_utc,
-                'end_time': None,
-                'equipment': equipment,
-                'total_cost': float(total_cost),
-                'is_active': True
-            }).execute()
-        
+        # Update-or-create the active measurement in one atomic round-trip
+        # via the sync_active_measurement stored function (p_end_time NULL
+        # means "keep/create an active measurement")
+        result = supabase_client.rpc('sync_active_measurement', {
+            'p_start_time': start_time_utc,
+            'p_end_time': None,
+            'p_equipment': equipment,
+            'p_total_cost': total_cost
+        }).execute()
+
+        _invalidate_active_measurement_cache()
+
         if result.data:
-            print(f'[API] ✓ Active measurement created/updated: {result.data[0] if isinstance(result.data, list) else result.data}')
+            logger.info(f'[API] ✓ Active measurement created/updated: {result.data[0] if isinstance(result.data, list) else result.data}')
             return jsonify({
                 'success': True,
                 'message': 'Active measurement synced',
@@ -975,7 +1297,7 @@ def create_active_measurement():
             }), 500
         
     except Exception as e:
-        print(f'[API] ✗ Error syncing active measurement: {e}')
+        logger.error(f'[API] ✗ Error syncing active measurement: {e}')
         return jsonify({
             'success': False,
             'message': 'Error syncing active measurement',
@@ -997,11 +1319,14 @@ def delete_measurement(measurement_id):
             .delete()\
             .eq('id', measurement_id)\
             .execute()
-        
+
+        _invalidate_active_measurement_cache()
+
         deleted_count = len(result.data) if result.data else 0
-        
+
         if deleted_count > 0:
-            print(f'[API] ✓ Deleted measurement: id={measurement_id}')
+            _bump_measurements_generation()
+            logger.info(f'[API] ✓ Deleted measurement: id={measurement_id}')
             return jsonify({
                 'success': True,
                 'message': 'Measurement deleted successfully',
@@ -1014,110 +1339,144 @@ def delete_measurement(measurement_id):
             }), 404
         
     except Exception as e:
-        print(f'[API] ✗ Error deleting measurement: {e}')
+        logger.error(f'[API] ✗ Error deleting measurement: {e}')
         return jsonify({
             'success': False,
             'message': 'Error deleting measurement',
             'error': str(e)
         }), 500
 
+def _fetch_ree_prices(date: str) -> Dict:
+    """Fetch and process REE prices for a date. Raises on any failure."""
+    # Try to fetch real data from REE API
+    params = {**REE_STATIC_PARAMS, 'start_date': f"{date}T00:00", 'end_date': f"{date}T23:59"}
+
+    logger.debug(f'[API] Fetching REE data for date: {date}')
+
+    response = _ree_session.get(REE_URL, params=params, headers=REE_HEADERS, timeout=10)
+
+    if response.status_code != 200:
+        raise Exception(f"REE API error: {response.status_code}")
+
+    data = orjson.loads(response.content)
+    logger.debug(f'[API] REE API response received')
+
+    # Process REE data
+    processed_prices = []
+
+    if data.get('included') and len(data['included']) > 0:
+        # Find the price indicator in the response
+        price_indicator = None
+        for indicator in data['included']:
+            attrs = indicator.get('attributes', {})
+
+            # Look for PVPC or price-related indicators: one scan of
+            # title+magnitude instead of six substring checks
+            if _PRICE_RE.search(f"{attrs.get('title', '')}\x00{attrs.get('magnitude', '')}"):
+                price_indicator = indicator
+                break
+
+        if price_indicator and price_indicator.get('attributes', {}).get('values'):
+            values = price_indicator['attributes']['values']
+
+            # Single tight pass over the price points with hot names bound to
+            # locals, so the per-element work is just divide/round/classify
+            hour_period = HOUR_PERIOD
+            append = processed_prices.append
+            for value_data in values:
+                datetime_str = value_data.get('datetime')
+                price_value = value_data.get('value', 0)
+
+                if datetime_str and price_value:
+                    # ISO 8601 has a fixed layout, so the hour lives at a
+                    # fixed offset; full datetime parsing only on odd input
+                    try:
+                        hour = int(datetime_str[11:13])
+                    except (ValueError, IndexError):
+                        hour = datetime.fromisoformat(datetime_str.replace('Z', '+00:00')).hour
+
+                    # Convert from €/MWh to €/kWh (rounded to 3 decimals)
+                    append({
+                        'hour': hour,
+                        'price': round(price_value) / 1000,
+                        'date': date,
+                        'period': hour_period[hour],
+                        'datetime': datetime_str
+                    })
+
+    if not processed_prices:
+        raise Exception('No price data found in REE response')
+
+    # Sort by hour
+    processed_prices.sort(key=lambda x: x['hour'])
+    logger.info(f'[API] ✓ Processed {len(processed_prices)} price points from REE')
+
+    return {
+        'success': True,
+        'source': 'ree',
+        'data': processed_prices,
+        'lastUpdate': data.get('data', {}).get('attributes', {}).get('last-update', datetime.now(timezone.utc).isoformat()),
+        'message': 'Data retrieved from REE API'
+    }
+
+def _price_response(payload: Dict, date: str):
+    """Build a price response with ETag/Cache-Control, honouring If-None-Match"""
+    key = f"{date}|{payload.get('source')}|{payload.get('lastUpdate', '')}"
+    etag = f'"{blake2s(key.encode(), digest_size=8).hexdigest()}"'
+    headers = {'ETag': etag, 'Cache-Control': 'public, max-age=3600'}
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, headers
+    response = jsonify(payload)
+    response.headers.extend(headers)
+    return response
+
 @app.route('/api/electricity-prices', methods=['GET'])
 def get_electricity_prices():
     """Get Spanish electricity prices (REE API or simulated)"""
+    # One clock read per request: the same "today" decides both the default
+    # date and the cache TTL below, so they can never disagree across a
+    # midnight boundary
+    today = datetime.now(UTC).strftime('%Y-%m-%d')
+    date = request.args.get('date', today)
+
+    # Serve from cache when the entry hasn't expired yet
+    cached = _price_cache.get(date)
+    if cached is not None:
+        return _price_response(cached, date)
+
+    # Single-flight: the first miss for a date does the fetch, concurrent
+    # misses wait on the same future instead of hammering REE in parallel
+    with _inflight_lock:
+        future = _inflight.get(date)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[date] = future
+
     try:
-        date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
-        
-        # Try to fetch real data from REE API
-        start_date = f"{date}T00:00"
-        end_date = f"{date}T23:59"
-        
-        ree_api_url = f"https://apidatos.ree.es/es/datos/mercados/precios-mercados-tiempo-real?start_date={start_date}&end_date={end_date}&time_trunc=hour&geo_trunc=electric_system&geo_limit=peninsular&geo_ids=8741"
-        
-        print(f'[API] Fetching REE data for date: {date}')
-        
-        response = requests.get(ree_api_url, headers={
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'Host': 'apidatos.ree.es'
-        }, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            print(f'[API] REE API response received')
-            
-            # Process REE data
-            processed_prices = []
-            
-            if data.get('included') and len(data['included']) > 0:
-                # Find the price indicator in the response
-                price_indicator = None
-                for indicator in data['included']:
-                    attrs = indicator.get('attributes', {})
-                    title = attrs.get('title', '').lower()
-                    magnitude = attrs.get('magnitude', '').lower()
-                    
-                    # Look for PVPC or price-related indicators
-                    if ('pvpc' in title or 
-                        'precio' in title or 
-                        'price' in title or
-                        '€/mwh' in magnitude or
-                        'euro' in magnitude or
-                        'mwh' in magnitude):
-                        price_indicator = indicator
-                        break
-                
-                if price_indicator and price_indicator.get('attributes', {}).get('values'):
-                    values = price_indicator['attributes']['values']
-                    
-                    for value_data in values:
-                        datetime_str = value_data.get('datetime')
-                        price_value = value_data.get('value', 0)
-                        
-                        if datetime_str and price_value:
-                            dt = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
-                            hour = dt.hour
-                            
-                            # Convert from €/MWh to €/kWh
-                            price_per_kwh = price_value / 1000.0
-                            
-                            # Determine period
-                            period = "llano"
-                            if hour >= 0 and hour < 8:
-                                period = "valle"
-                            elif (hour >= 10 and hour < 14) or (hour >= 18 and hour < 22):
-                                period = "punta"
-                            
-                            processed_prices.append({
-                                'hour': hour,
-                                'price': round(price_per_kwh * 1000) / 1000,
-                                'date': date,
-                                'period': period,
-                                'datetime': datetime_str
-                            })
-            
-            if processed_prices:
-                # Sort by hour
-                processed_prices.sort(key=lambda x: x['hour'])
-                print(f'[API] ✓ Processed {len(processed_prices)} price points from REE')
-                
-                return jsonify({
-                    'success': True,
-                    'source': 'ree',
-                    'data': processed_prices,
-                    'lastUpdate': data.get('data', {}).get('attributes', {}).get('last-update', datetime.now(timezone.utc).isoformat()),
-                    'message': 'Data retrieved from REE API'
-                })
+        if is_owner:
+            try:
+                payload = _fetch_ree_prices(date)
+            except Exception as e:
+                future.set_exception(e)
+                raise
             else:
-                raise Exception('No price data found in REE response')
+                future.set_result(payload)
+
+            # Today's prices may still change; past days are immutable
+            ttl = PRICE_CACHE_TTL_TODAY if date == today else PRICE_CACHE_TTL_PAST
+            _price_cache.put(date, payload, ttl)
         else:
-            raise Exception(f"REE API error: {response.status_code}")
-        
+            payload = future.result(timeout=15)
+
+        # Let browsers/CDNs reuse the payload too; prices change hourly at most
+        return _price_response(payload, date)
+
     except Exception as e:
-        print(f'[API] ✗ Error fetching REE prices: {e}')
-        print(f'[API] Falling back to simulated data')
-        
-        # Fallback to simulated data
-        date = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+        logger.error(f'[API] ✗ Error fetching REE prices: {e}')
+        logger.debug(f'[API] Falling back to simulated data')
+
+        # Fallback to simulated data (not cached, so transient REE failures self-heal)
         return jsonify({
             'success': True,
             'source': 'fallback',
@@ -1125,39 +1484,30 @@ def get_electricity_prices():
             'message': 'Using simulated data due to API error',
             'error': str(e)
         })
+    finally:
+        if is_owner:
+            with _inflight_lock:
+                _inflight.pop(date, None)
 
+@lru_cache(maxsize=32)
 def generate_fallback_prices(date: str) -> List[Dict]:
-    """Generate simulated electricity prices"""
-    mock_prices = []
-    
-    for hour in range(24):
-        base_price = 0.12  # Base price in €/kWh
-        
-        # Simulate variations by time of day
-        if hour >= 0 and hour < 8:
-            # Valle (low) period
-            variation = random.uniform(-0.03, 0.01)
-            period = "valle"
-        elif (hour >= 10 and hour < 14) or (hour >= 18 and hour < 22):
-            # Punta (peak) period
-            variation = random.uniform(0.02, 0.06)
-            period = "punta"
-        else:
-            # Llano (flat) period
-            variation = random.uniform(-0.01, 0.02)
-            period = "llano"
-        
-        price = round((base_price + variation) * 1000) / 1000
-        
-        mock_prices.append({
+    """Generate simulated electricity prices (deterministic per date)"""
+    # Seed from the date so repeated polls for the same day return the same
+    # prices; the lru_cache then skips regenerating the 24 rows entirely
+    rng = random.Random(date)
+    uniform = rng.uniform
+    # Base price 0.12 €/kWh plus the precomputed per-hour variation bounds;
+    # a single comprehension with no per-hour branching
+    return [
+        {
             'hour': hour,
-            'price': price,
+            'price': round((0.12 + uniform(low, high)) * 1000) / 1000,
             'date': date,
-            'period': period,
-            'datetime': f"{date}T{hour:02d}:00:00"
-        })
-    
-    return mock_prices
+            'period': HOUR_PERIOD[hour],
+            'datetime': f"{date}T{_HOUR_SUFFIX[hour]}"
+        }
+        for hour, (low, high) in enumerate(_HOUR_VARIATION)
+    ]
 
 if __name__ == '__main__':
     print("=" * 50)
@@ -1171,5 +1521,8 @@ if __name__ == '__main__':
     print("  - POST /api/relay-control (Dashboard/ESP32 controls relay)")
     print("  - GET  /api/electricity-prices (Dashboard gets REE prices)")
     print("=" * 50)
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    print("For production use: gunicorn -c gunicorn_conf.py wsgi:app")
+    print("=" * 50)
+    # Werkzeug dev server; debug/reloader only when DEV=1 is set
+    app.run(host='0.0.0.0', port=5000, debug=bool(os.environ.get('DEV')))
 
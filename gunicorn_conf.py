@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for production serving.
+
+Run with:
+    gunicorn -c gunicorn_conf.py wsgi:app
+
+wsgi.py applies gevent's monkey.patch_all() before importing the app, so
+every blocking Supabase/REE call yields cooperatively and one worker can
+multiplex hundreds of concurrent ESP32/dashboard connections (including
+long-polling /api/relay-control requests).
+"""
+
+bind = '0.0.0.0:5000'
+worker_class = 'gevent'
+# Exactly one worker: the relay command/state, the long-poll event, the
+# readings cache and the active-measurement cache all live in process
+# memory, so a second worker would see none of a first worker's relay
+# commands. The gevent greenlets provide all the concurrency this
+# I/O-bound app needs; only scale workers after moving that state to
+# shared storage.
+workers = 1
+worker_connections = 500
+
+# Workers import api_server after the fork, so each one gets its own
+# Supabase client, httpx pool and requests session (no shared sockets)
+preload_app = False
+
+# Long-polling requests can legitimately hold a connection for ~25 s
+timeout = 60
+keepalive = 5
+
+accesslog = None  # per-request access logging costs more than it tells us
+errorlog = '-'
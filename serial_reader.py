@@ -0,0 +1,197 @@
+"""
+Serial bridge for the wired ESP32 sketch (code_serial.ino).
+
+The wired sketch has no WiFi: it prints each 5-second RMS reading on the
+USB serial port instead of POSTing it. This script runs on the computer
+the ESP32 is plugged into, parses those lines and forwards them to the
+Flask API (the same /api/arduino-data endpoint the wireless firmware
+uses), so the dashboard works identically in both setups.
+
+Lines understood:
+    DATA:<current>,<vibration>     normal firmware output (code_serial.ino)
+    I_RMS_avg_5s (A): <current>    verbose debug output
+
+Usage:
+    python serial_reader.py            # uses SERIAL_PORT/API_URL env vars
+"""
+
+import io
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import orjson
+import requests
+import serial
+
+SERIAL_PORT = os.environ.get(
+    'SERIAL_PORT', 'COM3' if sys.platform == 'win32' else '/dev/ttyUSB0')
+BAUD_RATE = 115200
+# Mains voltage assumed by the API; pre-divided so the per-reading power
+# computation is a single multiply (division is the slower FP op)
+STANDARD_VOLTAGE = 230.0
+_POWER_KW_PER_AMP = STANDARD_VOLTAGE / 1000.0
+API_URL = os.environ.get('API_URL', 'http://localhost:5000/api/arduino-data')
+BATCH_URL = API_URL.rstrip('/') + '/batch'
+
+# How often to echo readings to the console (the API gets every reading)
+PRINT_INTERVAL_SECONDS = 1.0
+
+# Readings are accumulated and sent as one {"readings": [...]} POST to the
+# batch endpoint; HTTP/header overhead dominates the ~120-byte payload, so
+# batching cuts request count by up to BATCH_MAX_READINGS x
+BATCH_MAX_READINGS = 10
+BATCH_MAX_AGE_SECONDS = 1.0
+
+# Both firmware formats start with a fixed literal prefix, so the hot path
+# is a prefix compare + float() with no regex VM involved; the compiled
+# number regex only handles lines in neither format (corrupted frames)
+DATA_PREFIX = 'DATA:'
+RMS_PREFIX = 'I_RMS_avg_5s (A):'
+NUM_RE = re.compile(r'[-+]?\d+\.\d+')
+
+# One keep-alive session for all POSTs: a fresh requests.post() opens a new
+# TCP connection per reading (handshake + TIME_WAIT churn every 5 s); the
+# pooled connection is reused across samples
+SESSION = requests.Session()
+SESSION.headers['Content-Type'] = 'application/json'
+SESSION.mount('http://', requests.adapters.HTTPAdapter(
+    pool_connections=1, pool_maxsize=4))
+
+# The read loop must get back to ser.readline() quickly: a slow API (up to
+# the 2 s timeout) would otherwise back-pressure the UART and risk dropped
+# frames. Readings are queued here and a daemon worker does the POSTs and
+# the console logging.
+POST_QUEUE: queue.Queue = queue.Queue(maxsize=1000)
+
+
+ERROR_PRINT_INTERVAL_SECONDS = 5.0
+
+
+def _post_worker() -> None:
+    # monotonic() is a vDSO call immune to wall-clock jumps; last_err also
+    # time-bounds the error spam while the API is down
+    last_print = time.monotonic()
+    last_err = 0.0
+    while True:
+        timestamp_display, rms_current, power_kw, vibration, readings = \
+            POST_QUEUE.get()
+        try:
+            # Split connect/read timeouts: an unreachable API fails in
+            # 200 ms instead of holding the worker for the full 2 s, and
+            # the API never redirects so skip that handling
+            # orjson serializes the payload in C; json= would go through
+            # the stdlib encoder on every batch
+            response = SESSION.post(
+                BATCH_URL, data=orjson.dumps({'readings': readings}),
+                timeout=(0.2, 1.0), allow_redirects=False)
+            # Build the status line only when it will actually be printed;
+            # formatting five floats is wasted work on suppressed iterations
+            now_m = time.monotonic()
+            if now_m - last_print >= PRINT_INTERVAL_SECONDS:
+                print(f'[{timestamp_display}] I={rms_current:.4f} A  '
+                      f'P={power_kw:.3f} kW  vib={vibration:.3f}  '
+                      f'({len(readings)} readings) -> {response.status_code}')
+                last_print = now_m
+        except requests.exceptions.RequestException as e:
+            now_m = time.monotonic()
+            if now_m - last_err >= ERROR_PRINT_INTERVAL_SECONDS:
+                print(f'[{timestamp_display}] ✗ API error: {e}', flush=True)
+                last_err = now_m
+
+
+def main() -> None:
+    print(f'Opening {SERIAL_PORT} @ {BAUD_RATE} baud...', flush=True)
+    ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
+    # Windows exposes the driver RX buffer size; enlarge it so bursts
+    # survive host scheduling hiccups (the reader itself already blocks in
+    # the kernel via the read timeout rather than polling in_waiting)
+    if hasattr(ser, 'set_buffer_size'):
+        try:
+            ser.set_buffer_size(rx_size=65536)
+        except (serial.SerialException, OSError):
+            pass
+    # Buffered text reader: the OS hands us whole buffers and the newline
+    # scan happens in C, instead of pyserial's byte-at-a-time readline;
+    # errors='ignore' also covers garbled bytes during ESP32 resets
+    reader = io.TextIOWrapper(
+        io.BufferedReader(ser, buffer_size=4096),
+        encoding='utf-8', errors='ignore', newline='\n')
+    print(f'Forwarding readings to {API_URL}', flush=True)
+
+    threading.Thread(target=_post_worker, daemon=True).start()
+
+    pending = []
+    last_flush = time.monotonic()
+
+    def send_reading(rms_current: float, vibration: float) -> None:
+        """Build the API payload for one reading and flush the batch if due"""
+        nonlocal pending, last_flush
+        # One clock read per reading; the console time (UTC, HH:MM:SS) is
+        # sliced out of the ISO string instead of a second strftime call
+        timestamp_iso = datetime.now(timezone.utc).isoformat()
+        timestamp_display = timestamp_iso[11:19]
+        power_kw = rms_current * _POWER_KW_PER_AMP
+        pending.append({
+            'current': rms_current,
+            'vibration': vibration,
+            'timestamp': timestamp_iso
+        })
+        if (len(pending) < BATCH_MAX_READINGS
+                and time.monotonic() - last_flush <= BATCH_MAX_AGE_SECONDS):
+            return
+
+        try:
+            POST_QUEUE.put_nowait(
+                (timestamp_display, rms_current, power_kw, vibration, pending))
+        except queue.Full:
+            print(f'[{timestamp_display}] ⚠ POST queue full, '
+                  f'dropping {len(pending)} readings', flush=True)
+        pending = []
+        last_flush = time.monotonic()
+
+    while True:
+        # Empty string means the 1 s read timeout elapsed with no full line
+        line = reader.readline().strip()
+        if not line:
+            continue
+
+        # Dispatch on the first byte before comparing whole prefixes; boot
+        # banners and status chatter mostly fail this single-char check
+        first = line[0]
+        try:
+            if first == 'D' and line.startswith(DATA_PREFIX):
+                current_str, _, vibration_str = \
+                    line[len(DATA_PREFIX):].partition(',')
+                rms_current = float(current_str)
+                vibration = float(vibration_str) if vibration_str else 0.0
+            elif first == 'I' and line.startswith(RMS_PREFIX):
+                rms_current = float(line[len(RMS_PREFIX):])
+                vibration = 0.0
+            else:
+                raise ValueError
+        except ValueError:
+            # Fallback: pull any decimal numbers out of the line
+            numbers = NUM_RE.findall(line)
+            if not numbers:
+                # Boot banner / status chatter from the sketch
+                print(f'[ESP32] {line}')
+                continue
+            rms_current = float(numbers[0])
+            vibration = float(numbers[1]) if len(numbers) > 1 else 0.0
+
+        send_reading(rms_current, vibration)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print('\nStopped.')
+    except serial.SerialException as e:
+        print(f'✗ Serial error: {e}')
+        sys.exit(1)
@@ -15,9 +15,18 @@ CREATE TABLE IF NOT EXISTS power_readings (
 );
 
 -- Create index for fast timestamp-based queries
-CREATE INDEX IF NOT EXISTS idx_power_readings_timestamp 
+CREATE INDEX IF NOT EXISTS idx_power_readings_timestamp
   ON power_readings(timestamp DESC);
 
+-- Composite index for equipment + time-range queries (get_power_readings)
+CREATE INDEX IF NOT EXISTS idx_power_readings_equipment_ts
+  ON power_readings(equipment, timestamp);
+
+-- Partial index for the update-equipment path, which backfills rows with
+-- "timestamp >= ? AND equipment IS NULL"
+CREATE INDEX IF NOT EXISTS idx_power_readings_ts_equipment_null
+  ON power_readings(timestamp) WHERE equipment IS NULL;
+
 -- Optional: Enable Row Level Security (RLS) if needed
 -- ALTER TABLE power_readings ENABLE ROW LEVEL SECURITY;
 
@@ -48,6 +57,71 @@ CREATE INDEX IF NOT EXISTS idx_measurements_equipment
 CREATE INDEX IF NOT EXISTS idx_measurements_is_active 
   ON measurements(is_active) WHERE is_active = TRUE;
 
+-- At most one active measurement, enforced by the database itself. The
+-- expression index lets INSERT ... ON CONFLICT below resolve races between
+-- two clients starting a measurement at the same time.
+CREATE UNIQUE INDEX IF NOT EXISTS measurements_one_active
+  ON measurements((is_active)) WHERE is_active;
+
+-- Atomic "sync the active measurement" used by the API via supabase.rpc().
+-- Replaces the old select -> update -> insert sequence (three HTTP round-trips)
+-- with one call that runs entirely inside Postgres:
+--   * p_end_time set:  close the active measurement (matching start_time if
+--     possible, otherwise whichever is active), or record a completed one.
+--   * p_end_time NULL: update the active measurement in place, or create it.
+CREATE OR REPLACE FUNCTION sync_active_measurement(
+  p_start_time TIMESTAMPTZ,
+  p_end_time TIMESTAMPTZ,
+  p_equipment TEXT,
+  p_total_cost FLOAT
+) RETURNS SETOF measurements
+LANGUAGE plpgsql AS $$
+DECLARE
+  result measurements%ROWTYPE;
+BEGIN
+  IF p_end_time IS NOT NULL THEN
+    -- Prefer the active measurement with this exact start_time
+    UPDATE measurements
+      SET end_time = p_end_time, total_cost = p_total_cost, is_active = FALSE
+      WHERE is_active AND start_time = p_start_time
+      RETURNING * INTO result;
+    IF NOT FOUND THEN
+      -- Timestamp formats may differ slightly; close whichever is active
+      UPDATE measurements
+        SET start_time = p_start_time, end_time = p_end_time,
+            equipment = p_equipment, total_cost = p_total_cost,
+            is_active = FALSE
+        WHERE id = (SELECT id FROM measurements WHERE is_active
+                    ORDER BY start_time DESC LIMIT 1)
+        RETURNING * INTO result;
+    END IF;
+    IF result.id IS NULL THEN
+      -- Nothing was active: record a completed measurement directly
+      INSERT INTO measurements (start_time, end_time, equipment, total_cost, is_active)
+        VALUES (p_start_time, p_end_time, p_equipment, p_total_cost, FALSE)
+        RETURNING * INTO result;
+    END IF;
+  ELSE
+    UPDATE measurements
+      SET start_time = p_start_time, equipment = p_equipment, total_cost = p_total_cost
+      WHERE is_active
+      RETURNING * INTO result;
+    IF NOT FOUND THEN
+      -- The measurements_one_active unique index turns a concurrent start
+      -- into an update of the winner's row instead of a second active row
+      INSERT INTO measurements (start_time, end_time, equipment, total_cost, is_active)
+        VALUES (p_start_time, NULL, p_equipment, p_total_cost, TRUE)
+        ON CONFLICT ((is_active)) WHERE is_active
+        DO UPDATE SET start_time = EXCLUDED.start_time,
+                      equipment = EXCLUDED.equipment,
+                      total_cost = EXCLUDED.total_cost
+        RETURNING * INTO result;
+    END IF;
+  END IF;
+  RETURN NEXT result;
+END;
+$$;
+
 -- Add equipment column if table already exists (run this if table was created before)
 -- ALTER TABLE power_readings ADD COLUMN IF NOT EXISTS equipment TEXT NULL;
 
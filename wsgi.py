@@ -0,0 +1,18 @@
+"""
+WSGI entrypoint for production serving.
+
+Run with:
+    gunicorn -k gevent -w 1 -b 0.0.0.0:5000 --worker-connections 1000 wsgi:app
+
+The gevent worker multiplexes many concurrent ESP32/dashboard connections
+(including long-polling /api/relay-control requests) on a single process.
+For local development, `python api_server.py` still starts the Flask dev server.
+"""
+
+# Must run before anything imports socket/ssl/threading, so every blocking
+# Supabase/REE call cooperatively yields instead of pinning the worker
+from gevent import monkey
+
+monkey.patch_all()
+
+from api_server import app  # noqa: E402,F401